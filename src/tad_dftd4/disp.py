@@ -219,13 +219,16 @@ def dispersion2(
     qq = 3 * r4r2.unsqueeze(-1) * r4r2.unsqueeze(-2)
     c8 = c6 * qq
 
+    # combine real pairs and cutoff only once for all damping orders
+    mask = mask * (distances <= cutoff)
+
     t6 = torch.where(
-        mask * (distances <= cutoff),
+        mask,
         damping_function(6, distances, qq, param, **kwargs),
         zero,
     )
     t8 = torch.where(
-        mask * (distances <= cutoff),
+        mask,
         damping_function(8, distances, qq, param, **kwargs),
         zero,
     )
@@ -243,7 +246,7 @@ def dispersion2(
     if "s10" in param:
         c10 = c6 * torch.pow(qq, 2) * 49.0 / 40.0
         t10 = torch.where(
-            mask * (distances <= cutoff),
+            mask,
             damping_function(10, distances, qq, param, **kwargs),
             zero,
         )
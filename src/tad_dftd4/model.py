@@ -24,6 +24,18 @@ evaluation of C6 coefficients.
 Upon instantiation, the reference polarizabilities are calculated for the
 unique species/elements of the molecule(s) and stored in the model class.
 
+.. note::
+
+   `D4Model.weight_references` only consists of element-wise operations and
+   reductions on tensors stored in the model, without host transfers or
+   data-dependent control flow. Hence, it can be wrapped with `torch.compile`
+   (PyTorch 2.0 or newer) by the user, e.g.,
+   `torch.compile(model.weight_references)`. The first call triggers the
+   compilation, while subsequent calls with the same shapes reuse the
+   compiled kernels. The compiled `weight_references` supports forward passes
+   and first-order gradients, but not double backward, i.e., it cannot be used
+   for Hessians.
+
 
 Example
 -------
@@ -73,7 +85,33 @@ class D4Model(TensorLike):
     alpha: Tensor
     """Reference polarizabilities of unique species."""
 
-    __slots__ = ("numbers", "ga", "gc", "wf", "alpha")
+    refc: Tensor
+    """Number of Gaussian weights of the references of all atoms."""
+
+    refq: Tensor
+    """Reference charges of all atoms."""
+
+    refcovcn: Tensor
+    """Reference coordination numbers of all atoms (always `torch.double`)."""
+
+    zeff: Tensor
+    """Effective nuclear charges of all atoms."""
+
+    gam: Tensor
+    """Chemical hardnesses of all atoms."""
+
+    __slots__ = (
+        "numbers",
+        "ga",
+        "gc",
+        "wf",
+        "alpha",
+        "refc",
+        "refq",
+        "refcovcn",
+        "zeff",
+        "gam",
+    )
 
     def __init__(
         self,
@@ -82,6 +120,11 @@ class D4Model(TensorLike):
         gc: float = gc_default,
         wf: float = wf_default,
         alpha: Tensor | None = None,
+        refc: Tensor | None = None,
+        refq: Tensor | None = None,
+        refcovcn: Tensor | None = None,
+        zeff: Tensor | None = None,
+        gam: Tensor | None = None,
         device: torch.device | None = None,
         dtype: torch.dtype | None = None,
     ) -> None:
@@ -102,7 +145,25 @@ class D4Model(TensorLike):
             Weighting factor for coordination number interpolation.
             Defaults to `wf_default`.
         alpha : Tensor | None, optional
-            Reference polarizabilities of unique species. Defaults to `None`.
+            Reference polarizabilities of unique species. Defaults to `None`,
+            i.e., they are calculated for the unique species of `numbers`.
+            Precomputed values are converted to the device and dtype of the
+            model.
+        refc : Tensor | None, optional
+            Number of Gaussian weights of the references of all atoms.
+            Defaults to `None`, i.e., gathered from `params.refc`.
+        refq : Tensor | None, optional
+            Reference charges of all atoms. Defaults to `None`, i.e., gathered
+            from `params.refq`.
+        refcovcn : Tensor | None, optional
+            Reference coordination numbers of all atoms. Defaults to `None`,
+            i.e., gathered from `params.refcovcn`.
+        zeff : Tensor | None, optional
+            Effective nuclear charges of all atoms. Defaults to `None`, i.e.,
+            gathered from `data.ZEFF`.
+        gam : Tensor | None, optional
+            Chemical hardnesses of all atoms. Defaults to `None`, i.e.,
+            gathered from `data.GAM`.
         device : torch.device | None, optional
             Pytorch device for calculations. Defaults to `None`.
         dtype : torch.dtype | None, optional
@@ -116,7 +177,30 @@ class D4Model(TensorLike):
         self.wf = wf
 
         if alpha is None:
-            self.alpha = self._set_refalpha_eeq()
+            alpha = self._set_refalpha_eeq()
+        self.alpha = alpha.to(**self.dd)
+
+        # The reference values of all atoms only depend on `numbers`. Hence,
+        # they are gathered once here instead of in every call of
+        # `weight_references`.
+        if refc is None:
+            refc = params.refc.to(self.device)[numbers]
+        if refq is None:
+            refq = params.refq.to(**self.dd)[numbers]
+        if refcovcn is None:
+            refcovcn = params.refcovcn.to(self.device)[numbers]
+        if zeff is None:
+            zeff = data.ZEFF.to(self.device)[numbers]
+        if gam is None:
+            gam = data.GAM.to(**self.dd)[numbers]
+
+        self.refc = refc.to(self.device)
+        self.refq = refq.to(**self.dd)
+        self.zeff = zeff.to(self.device)
+        self.gam = gam.to(**self.dd)
+
+        # see `weight_references` for why double precision is required
+        self.refcovcn = refcovcn.to(device=self.device, dtype=torch.double)
 
     @property
     def unique(self) -> Tensor:
@@ -167,8 +251,9 @@ class D4Model(TensorLike):
         if q is None:
             q = torch.zeros(self.numbers.shape, **self.dd)
 
-        refc = params.refc.to(self.device)[self.numbers]
-        refq = params.refq.to(**self.dd)[self.numbers]
+        zero = torch.tensor(0.0, **self.dd)
+
+        refc = self.refc
         mask = refc > 0
 
         # Due to the exponentiation, `norm` and `expw` may become very small
@@ -177,70 +262,62 @@ class D4Model(TensorLike):
         # Consequently, some values become zero although the actual result
         # should be close to one. The problem does not arise when using `torch.
         # double`. In order to avoid this error, which is also difficult to
-        # detect, this part always uses `torch.double`. `params.refcovcn` is
-        # saved with `torch.double`, but I still made sure...
-        refcn = params.refcovcn.to(device=self.device, dtype=torch.double)[self.numbers]
+        # detect, this part always uses `torch.double`. `D4Model.refcovcn` is
+        # always stored with `torch.double` (see `D4Model.__init__`).
+        refcn = self.refcovcn
+        zero_double = torch.tensor(0.0, device=self.device, dtype=torch.double)
+        tiny_double = torch.tensor(1e-300, device=self.device, dtype=torch.double)
 
         # For vectorization, we reformulate the Gaussian weighting function:
-        # exp(-wf * igw * (cn - cn_ref)^2) = [exp(-(cn - cn_ref)^2)]^(wf * igw)
-        # Gaussian weighting function part 1: exp(-(cn - cn_ref)^2)
+        # exp(-wf * igw * (cn - cn_ref)^2) = [exp(-wf * (cn - cn_ref)^2)]^igw
+        # Gaussian weighting function part 1: exp(-wf * (cn - cn_ref)^2)
         dcn = cn.unsqueeze(-1).type(torch.double) - refcn
-        tmp = torch.exp(-dcn * dcn)
+        t1 = torch.exp(-self.wf * dcn * dcn)
 
-        # Gaussian weighting function part 2: tmp^(wf * igw)
+        # Gaussian weighting function part 2: t1^igw
         # (While the Fortran version just loops over the number of gaussian
         # weights `igw`, we have to use masks and explicitly implement the
         # formulas for exponentiation. Luckily, `igw` only takes on the values
-        # 1 and 3.)
-        def refc_pow(n: int) -> Tensor:
-            return sum(
-                (torch.pow(tmp, i * self.wf) for i in range(1, n + 1)),
-                torch.tensor(0.0, device=tmp.device),
-            )
-
-        refc_pow_1 = torch.where(refc == 1, refc_pow(1), tmp)
-        refc_pow_final = torch.where(refc == 3, refc_pow(3), refc_pow_1)
+        # 1 and 3. Missing references (`refc == 0`) are masked below.)
+        t2 = t1 * t1
+        refc_pow_final = torch.where(refc == 3, t1 + t2 + t2 * t1, t1)
 
         expw = torch.where(
             mask,
             refc_pow_final,
-            torch.tensor(0.0, device=self.device, dtype=torch.double),  # double!
+            zero_double,
         )
 
         # normalize weights
         norm = torch.where(
             mask,
             torch.sum(expw, dim=-1, keepdim=True),
-            torch.tensor(1e-300, device=self.device, dtype=torch.double),  # double!)
+            tiny_double,
         )
         gw_temp = (expw / norm).type(self.dtype)  # back to real dtype
 
         # maximum reference CN for each atom
-        maxcn = torch.max(refcn, dim=-1, keepdim=True)[0]
+        maxcn = torch.amax(refcn, dim=-1, keepdim=True)
 
         # prevent division by 0 and small values
         exceptional = (torch.isnan(gw_temp)) | (gw_temp > torch.finfo(self.dtype).max)
 
         gw = torch.where(
             exceptional,
-            torch.where(
-                refcn == maxcn,
-                torch.tensor(1.0, **self.dd),
-                torch.tensor(0.0, **self.dd),
-            ),
+            (refcn == maxcn).type(self.dtype),
             gw_temp,
         )
 
         # unsqueeze for reference dimension
-        zeff = data.ZEFF.to(self.device)[self.numbers].unsqueeze(-1)
-        gam = data.GAM.to(**self.dd)[self.numbers].unsqueeze(-1) * self.gc
+        zeff = self.zeff.unsqueeze(-1)
+        gam = self.gam.unsqueeze(-1) * self.gc
         q = q.unsqueeze(-1)
 
         # charge scaling
         zeta = torch.where(
             mask,
-            self._zeta(gam, refq + zeff, q + zeff),
-            torch.tensor(0.0, **self.dd),
+            self._zeta(gam, self.refq + zeff, q + zeff),
+            zero,
         )
 
         return zeta * gw
@@ -260,11 +337,14 @@ class D4Model(TensorLike):
         Tensor
             C6 coefficients for all atom pairs of shape `(..., nat, nat)`.
         """
-        # (..., nunique, r, 23) -> (..., n, r, 23)
-        alpha = self.alpha[self.atom_to_unique]
+        # The integration only depends on the species, i.e., we integrate for
+        # all pairs of unique species and expand to all atom pairs afterwards.
+        # (nunique, r, 23) -> (nunique, nunique, r, r)
+        rc6 = trapzd(self.alpha)
 
-        # (..., n, r, 23) -> (..., n, n, r, r)
-        rc6 = trapzd(alpha)
+        # (nunique, nunique, r, r) -> (..., n, n, r, r)
+        idx = self.atom_to_unique
+        rc6 = rc6[idx.unsqueeze(-1), idx.unsqueeze(-2)]
 
         # The default einsum path is fastest if the large tensors comes first.
         # (..., n1, n2, r1, r2) * (..., n1, r1) * (..., n2, r2) -> (..., n1, n2)
@@ -303,10 +383,18 @@ class D4Model(TensorLike):
         """
         eps = torch.tensor(torch.finfo(self.dtype).eps, **self.dd)
         ga = torch.tensor(self.ga, **self.dd)
+
+        # Both branches of `torch.where` are evaluated (and differentiated).
+        # For `qmod <= 0`, the scaling would overflow and the resulting
+        # infinities turn into NaN's in the backward pass, even though the
+        # branch is not selected. Hence, we insert the reference charge there,
+        # for which the scaling is well-behaved (qref / qmod ~ 1).
+        mask = qmod > 0.0
+        qmod = torch.where(mask, qmod, qref)
         scale = torch.exp(gam * (1.0 - qref / (qmod - eps)))
 
         return torch.where(
-            qmod > 0.0,
+            mask,
             torch.exp(ga * (1.0 - scale)),
             torch.exp(ga),
         )
@@ -322,19 +410,19 @@ class D4Model(TensorLike):
         """
         zero = torch.tensor(0.0, **self.dd)
 
-        numbers = self.unique
-        refsys = params.refsys.to(self.device)[numbers]
-        refsq = params.refsq.to(**self.dd)[numbers]
-        refascale = params.refascale.to(**self.dd)[numbers]
-        refalpha = params.refalpha.to(**self.dd)[numbers]
-        refscount = params.refscount.to(**self.dd)[numbers]
-        secscale = params.secscale.to(**self.dd)
-        secalpha = params.secalpha.to(**self.dd)
+        numbers = self.unique.cpu()
+        refsys = params.refsys[numbers]
+        refsq = params.refsq[numbers].to(**self.dd)
+        refascale = params.refascale[numbers].to(**self.dd)
+        refalpha = params.refalpha[numbers].to(**self.dd)
+        refscount = params.refscount[numbers].to(**self.dd)
+        secscale = params.secscale[refsys].to(**self.dd)
+        secalpha = params.secalpha[refsys].to(**self.dd)
 
-        mask = refsys > 0
+        mask = refsys.to(self.device) > 0
 
-        zeff = data.ZEFF.to(self.device)[refsys]
-        gam = data.GAM.to(**self.dd)[refsys] * self.gc
+        zeff = data.ZEFF[refsys].to(self.device)
+        gam = data.GAM[refsys].to(**self.dd) * self.gc
 
         # charge scaling
         zeta = torch.where(
@@ -343,11 +431,42 @@ class D4Model(TensorLike):
             zero,
         )
 
-        aiw = secscale[refsys] * secalpha[refsys] * zeta.unsqueeze(-1)
+        aiw = secscale * secalpha * zeta.unsqueeze(-1)
         h = refalpha - refscount.unsqueeze(-1) * aiw
         alpha = refascale.unsqueeze(-1) * h
 
-        return torch.where(alpha > 0.0, alpha, zero)
+        return alpha.clamp_min(0.0)
+
+
+# integration weights for the Casimir--Polder integration (see `trapzd`)
+trapzd_weights = torch.tensor(
+    [
+        2.4999500000000000e-002,
+        4.9999500000000000e-002,
+        7.5000000000000010e-002,
+        0.1000000000000000,
+        0.1000000000000000,
+        0.1000000000000000,
+        0.1000000000000000,
+        0.1000000000000000,
+        0.1000000000000000,
+        0.1000000000000000,
+        0.1000000000000000,
+        0.1500000000000000,
+        0.2000000000000000,
+        0.2000000000000000,
+        0.2000000000000000,
+        0.2000000000000000,
+        0.3500000000000000,
+        0.5000000000000000,
+        0.7500000000000000,
+        1.0000000000000000,
+        1.7500000000000000,
+        2.5000000000000000,
+        1.2500000000000000,
+    ],
+    dtype=torch.float64,
+)
 
 
 def trapzd(polarizability: Tensor) -> Tensor:
@@ -366,32 +485,8 @@ def trapzd(polarizability: Tensor) -> Tensor:
     """
     thopi = 3.0 / 3.141592653589793238462643383279502884197
 
-    weights = torch.tensor(
-        [
-            2.4999500000000000e-002,
-            4.9999500000000000e-002,
-            7.5000000000000010e-002,
-            0.1000000000000000,
-            0.1000000000000000,
-            0.1000000000000000,
-            0.1000000000000000,
-            0.1000000000000000,
-            0.1000000000000000,
-            0.1000000000000000,
-            0.1000000000000000,
-            0.1500000000000000,
-            0.2000000000000000,
-            0.2000000000000000,
-            0.2000000000000000,
-            0.2000000000000000,
-            0.3500000000000000,
-            0.5000000000000000,
-            0.7500000000000000,
-            1.0000000000000000,
-            1.7500000000000000,
-            2.5000000000000000,
-            1.2500000000000000,
-        ]
+    weights = trapzd_weights.to(
+        device=polarizability.device, dtype=polarizability.dtype
     )
 
     # NOTE: In the old version, a memory inefficient intermediate tensor was
@@ -25,6 +25,7 @@ from tad_mctc.batch import pack
 from tad_mctc.data.molecules import mols as samples
 
 from tad_dftd4 import dftd4
+from tad_dftd4.model import D4Model
 from tad_dftd4.typing import DD
 
 from ..conftest import DEVICE
@@ -129,3 +130,23 @@ def test_batch(dtype: torch.dtype, name: str) -> None:
     pos.grad.data.zero_()
 
     assert not torch.isnan(grad_backward).any(), "Gradient contains NaN values"
+
+
+@pytest.mark.grad
+@pytest.mark.parametrize("dtype", [torch.float, torch.double])
+def test_charge_scaling(dtype: torch.dtype) -> None:
+    dd: DD = {"device": DEVICE, "dtype": dtype}
+
+    nums = torch.tensor([1, 1], device=DEVICE)
+    model = D4Model(nums, **dd)
+
+    # vanishing modified charge (q + Z_eff = 0) overflows the charge scaling
+    q = torch.tensor([-1.0, 0.0], **dd, requires_grad=True)
+
+    gw = model.weight_references(q=q)
+    assert not torch.isnan(gw).any(), "Weights contain NaN values"
+
+    gw.sum().backward()
+
+    assert q.grad is not None
+    assert not torch.isnan(q.grad).any(), "Gradient contains NaN values"
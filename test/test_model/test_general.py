@@ -62,3 +62,28 @@ def test_change_device_fail() -> None:
     # trying to use setter
     with pytest.raises(AttributeError):
         model.device = torch.device("cpu")
+
+
+def test_reuse_alpha() -> None:
+    numbers = torch.tensor([14, 1, 1, 1, 1])
+    model = D4Model(numbers, dtype=torch.double)
+    ref = model.get_atomic_c6(model.weight_references())
+
+    # precomputed reference polarizabilities are converted to the model dtype
+    model2 = D4Model(numbers, alpha=model.alpha, dtype=torch.float)
+    assert model2.alpha.dtype == torch.float
+
+    c6 = model2.get_atomic_c6(model2.weight_references())
+    assert c6.dtype == torch.float
+    assert pytest.approx(ref.float(), abs=1e-5, rel=1e-5) == c6
+
+
+def test_change_type_c6() -> None:
+    numbers = torch.tensor([14, 1, 1, 1, 1])
+    model = D4Model(numbers, dtype=torch.double).type(torch.float)
+    ref = D4Model(numbers, dtype=torch.float)
+
+    c6 = model.get_atomic_c6(model.weight_references())
+    c6_ref = ref.get_atomic_c6(ref.weight_references())
+    assert c6.dtype == torch.float
+    assert pytest.approx(c6_ref, abs=1e-5, rel=1e-5) == c6